@@ -1,30 +1,44 @@
 from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo.errors import PyMongoError
 import os
 import logging
+import functools
+from collections import defaultdict
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, BinaryIO, Tuple
 import uuid
 from datetime import datetime
 import pandas as pd
-import io
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import re
 import numpy as np
+import orjson
+from numba import njit
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=50,
+    minPoolSize=5,
+    compressors='zstd,zlib',  # wire compression, in order of preference
+    zlibCompressionLevel=-1,
+    serverSelectionTimeoutMS=2000
+)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -34,13 +48,12 @@ class FinancialData(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
     upload_date: datetime = Field(default_factory=datetime.utcnow)
-    raw_data: List[Dict[str, Any]]
     detected_columns: Dict[str, str]
     kpis: Dict[str, float]
 
 class FinancialDataCreate(BaseModel):
     filename: str
-    raw_data: List[Dict[str, Any]]
+    raw_data: Dict[str, List[Any]]
 
 class KPIResponse(BaseModel):
     revenus_totaux: float
@@ -63,21 +76,161 @@ COLUMN_PATTERNS = {
     'date': ['date', 'periode', 'month', 'mois', 'year', 'annee', 'trimestre', 'quarter']
 }
 
+# orjson options used by ORJSONResponse, for hand-streamed JSON
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Exact pattern name -> financial type
+PATTERN_TO_TYPE = {
+    pattern: financial_type
+    for financial_type, patterns in COLUMN_PATTERNS.items() for pattern in patterns
+}
+
+# One alternation regex per type, matching columns that contain a pattern
+COLUMN_PATTERN_RES = {
+    financial_type: re.compile('|'.join(map(re.escape, sorted(patterns, key=len, reverse=True))))
+    for financial_type, patterns in COLUMN_PATTERNS.items()
+}
+
+# Every substring of each type's patterns, matching columns contained in a pattern
+COLUMN_PATTERN_SUBSTRINGS = {
+    financial_type: {
+        pattern[i:j] for pattern in patterns
+        for i in range(len(pattern) + 1) for j in range(i, len(pattern) + 1)
+    }
+    for financial_type, patterns in COLUMN_PATTERNS.items()
+}
+
+# Column types summed by calculate_kpis, in reduce_kpis column order
+KPI_COLUMN_TYPES = (
+    'revenus', 'charges', 'resultat_operationnel', 'amortissements',
+    'resultat_net', 'impots', 'cash_flow', 'investissements'
+)
+
+# Multithreaded Arrow CSV reader settings
+CSV_READ_OPTIONS = pacsv.ReadOptions(use_threads=True, block_size=1 << 20)
+
+# Arrow parse error for a row whose field count differs from the header
+COLUMN_COUNT_ERROR_RE = re.compile(r'Expected \d+ columns, got \d+')
+
+# Quoted cells may span lines (addresses, notes), as pandas.read_csv allows
+CSV_PARSE_OPTIONS = pacsv.ParseOptions(newlines_in_values=True)
+
+# NumPy dtype kinds that calculate_kpis reads without string cleanup
+NUMERIC_DTYPE_KINDS = 'biuf'
+
+# Currency symbols and whitespace stripped before numeric conversion
+CURRENCY_RE = re.compile(r'[€$£¥₹\s]')
+
+# Comma decimal separator -> dot
+COMMA_TO_DOT = str.maketrans(',', '.')
+
+# Both of the above as one translate table (all CURRENCY_RE matches are below U+3001)
+NUMERIC_CLEANUP_TABLE = {
+    **{ord(c): None for c in map(chr, range(0x3001)) if CURRENCY_RE.fullmatch(c)},
+    ord(','): '.'
+}
+
 def detect_columns(df: pd.DataFrame) -> Dict[str, str]:
     """Detect financial columns in the dataframe"""
+    detected = _detect_column_indices(tuple(df.columns))
+    return {financial_type: df.columns[idx] for financial_type, idx in detected.items()}
+
+@functools.lru_cache(maxsize=256)
+def _detect_column_indices(column_names: Tuple[str, ...]) -> Dict[str, int]:
+    """Map financial types to column positions, cached per CSV header"""
     detected = {}
-    columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
+    columns = [col.lower().replace(' ', '_').replace('-', '_') for col in column_names]
     
-    for financial_type, patterns in COLUMN_PATTERNS.items():
-        for col_idx, col in enumerate(columns):
-            for pattern in patterns:
-                if pattern in col or col in pattern:
-                    detected[financial_type] = df.columns[col_idx]
-                    break
-            if financial_type in detected:
-                break
+    # Exact pattern names win, with a single hash lookup per column
+    for idx, col in enumerate(columns):
+        financial_type = PATTERN_TO_TYPE.get(col)
+        if financial_type is not None and financial_type not in detected:
+            detected[financial_type] = idx
     
-    return detected
+    # Substring matching for the remaining types
+    for financial_type, pattern_re in COLUMN_PATTERN_RES.items():
+        if financial_type in detected:
+            continue
+        substrings = COLUMN_PATTERN_SUBSTRINGS[financial_type]
+        match = next(
+            (idx for idx, col in enumerate(columns) if pattern_re.search(col) or col in substrings),
+            None
+        )
+        if match is not None:
+            detected[financial_type] = match
+    
+    return {t: detected[t] for t in COLUMN_PATTERNS if t in detected}
+
+def clean_column_names(names: List[str]) -> List[str]:
+    """Name blank headers and number duplicates, like pandas.read_csv does"""
+    names = [name if name else f'Unnamed: {idx}' for idx, name in enumerate(names)]
+    header = set(names)
+    counts = defaultdict(int)
+    for idx, base in enumerate(names):
+        name = base
+        count = counts[base]
+        while count > 0:
+            counts[base] = count + 1
+            name = f'{base}.{count}'
+            count = count + 1 if name in header else counts[name]
+        names[idx] = name
+        counts[name] = count + 1
+    return names
+
+def read_csv_table(source: BinaryIO) -> pa.Table:
+    """Parse a CSV file object into an Arrow table"""
+    start = source.tell()
+    try:
+        # read_csv infers column types from the whole file, unlike open_csv
+        table = pacsv.read_csv(source, read_options=CSV_READ_OPTIONS, parse_options=CSV_PARSE_OPTIONS)
+        
+        # Re-read inferred date columns as text so the original values are kept,
+        # like pandas.read_csv does
+        dates = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+        if dates:
+            source.seek(start)
+            convert_options = pacsv.ConvertOptions(column_types={name: pa.string() for name in dates})
+            table = pacsv.read_csv(
+                source, read_options=CSV_READ_OPTIONS, parse_options=CSV_PARSE_OPTIONS,
+                convert_options=convert_options
+            )
+    except pa.ArrowInvalid as e:
+        if not COLUMN_COUNT_ERROR_RE.search(str(e)):
+            raise
+        # Arrow can't pad short rows; pandas fills the missing fields with NaN
+        source.seek(start)
+        try:
+            return pa.Table.from_pandas(pd.read_csv(source), preserve_index=False)
+        except pd.errors.ParserError as parser_error:
+            raise pa.ArrowInvalid(str(parser_error)) from parser_error
+    table = table.rename_columns(clean_column_names(table.column_names))
+    
+    # Arrow reads non-UTF-8 columns as binary; casting them raises ArrowInvalid
+    # like other parse errors
+    for idx, field in enumerate(table.schema):
+        if pa.types.is_binary(field.type):
+            table = table.set_column(idx, field.name, pc.cast(table.column(idx), pa.string()))
+    
+    return table
+
+def table_to_ipc_bytes(table: pa.Table) -> bytes:
+    """Serialize an Arrow table to a zstd-compressed IPC file"""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def raw_data_bucket() -> AsyncIOMotorGridFSBucket:
+    """GridFS bucket holding parsed CSV tables, keyed by financial data id"""
+    # Created per call: building it at import binds Motor to a loop that never runs
+    return AsyncIOMotorGridFSBucket(db, bucket_name='raw_data')
+
+async def load_raw_data(data_id: str) -> Dict[str, List[Any]]:
+    """Load the stored CSV table for an upload as column name -> values"""
+    grid_out = await raw_data_bucket().open_download_stream(data_id)
+    contents = await grid_out.read()
+    return pa.ipc.open_file(pa.BufferReader(contents)).read_all().to_pydict()
 
 def clean_numeric_value(value) -> float:
     """Clean and convert numeric values"""
@@ -89,71 +242,90 @@ def clean_numeric_value(value) -> float:
     
     # Remove currency symbols, spaces, and convert comma decimals
     str_value = str(value).strip()
-    str_value = re.sub(r'[€$£¥₹\s]', '', str_value)
-    str_value = str_value.replace(',', '.')
+    str_value = CURRENCY_RE.sub('', str_value)
+    str_value = str_value.translate(COMMA_TO_DOT)
     
     try:
         return float(str_value)
     except ValueError:
         return 0.0
 
-def calculate_kpis(df: pd.DataFrame, detected_columns: Dict[str, str]) -> Dict[str, float]:
-    """Calculate financial KPIs"""
-    kpis = {
-        'revenus_totaux': 0.0,
-        'ebitda': 0.0,
-        'resultat_net': 0.0,
-        'free_cash_flow': 0.0,
-        'marge_nette': 0.0
-    }
-    
-    # Clean and sum numeric columns
-    def get_column_sum(column_type: str) -> float:
-        if column_type in detected_columns:
-            col_name = detected_columns[column_type]
-            if col_name in df.columns:
-                return sum(clean_numeric_value(val) for val in df[col_name])
-        return 0.0
-    
-    # 1. Total Revenue
-    kpis['revenus_totaux'] = get_column_sum('revenus')
+@njit(cache=True, fastmath={'reassoc', 'contract'})
+def reduce_kpis(values: np.ndarray) -> Tuple[float, float, float, float, float]:
+    """Derive the KPIs from a (rows, KPI_COLUMN_TYPES) float64 matrix"""
+    sums = values.sum(axis=0)
+    revenus = sums[0]
+    charges = sums[1]
+    resultat_op = sums[2]
+    amortissements = sums[3]
+    net_income = sums[4]
+    impots = sums[5]
+    cash_flow = sums[6]
+    investissements = sums[7]
     
-    # 2. EBITDA calculation
-    resultat_op = get_column_sum('resultat_operationnel')
-    amortissements = get_column_sum('amortissements')
+    # EBITDA, falling back to Revenue - Operating Expenses
     if resultat_op > 0:
-        kpis['ebitda'] = resultat_op + amortissements
+        ebitda = resultat_op + amortissements
     else:
-        # Fallback: Revenue - Operating Expenses
-        revenus = kpis['revenus_totaux']
-        charges = get_column_sum('charges')
-        kpis['ebitda'] = revenus - charges
+        ebitda = revenus - charges
     
-    # 3. Net Income
-    net_income = get_column_sum('resultat_net')
+    # Net Income, falling back to Revenue - Expenses - Taxes
     if net_income > 0:
-        kpis['resultat_net'] = net_income
+        resultat_net = net_income
     else:
-        # Fallback calculation: EBITDA - Taxes - Interest
-        revenus = kpis['revenus_totaux']
-        charges = get_column_sum('charges')
-        impots = get_column_sum('impots')
-        kpis['resultat_net'] = revenus - charges - impots
-    
-    # 4. Free Cash Flow
-    cash_flow = get_column_sum('cash_flow')
-    investissements = get_column_sum('investissements')
+        resultat_net = revenus - charges - impots
+    
+    # Free Cash Flow, approximated with Net Income when missing
     if cash_flow > 0:
-        kpis['free_cash_flow'] = cash_flow - investissements
+        free_cash_flow = cash_flow - investissements
     else:
-        # Approximate with Net Income
-        kpis['free_cash_flow'] = kpis['resultat_net'] - investissements
+        free_cash_flow = resultat_net - investissements
+    
+    # Net Margin (%)
+    marge_nette = 0.0
+    if revenus > 0:
+        marge_nette = (resultat_net / revenus) * 100
+    
+    return revenus, ebitda, resultat_net, free_cash_flow, marge_nette
+
+def calculate_kpis(df: pd.DataFrame, detected_columns: Dict[str, str]) -> Dict[str, float]:
+    """Calculate financial KPIs"""
+    needed = {
+        k: detected_columns[k] for k in KPI_COLUMN_TYPES
+        if k in detected_columns and detected_columns[k] in df.columns
+    }
+    columns = list(dict.fromkeys(needed.values()))
+    # Bool, int, uint and float columns are summed as-is, without cleaning
+    text_cols = [col for col in columns if df[col].dtype.kind not in NUMERIC_DTYPE_KINDS]
     
-    # 5. Net Margin (%)
-    if kpis['revenus_totaux'] > 0:
-        kpis['marge_nette'] = (kpis['resultat_net'] / kpis['revenus_totaux']) * 100
+    numeric = {
+        col: df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        for col in columns if col not in text_cols
+    }
+    for col in text_cols:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == 'boolean':
+            # Nullable bools come back as object dtype; True still counts as 1
+            numeric[col] = df[col].astype('boolean').to_numpy(dtype=np.float64, na_value=np.nan)
+            continue
+        # Vectorized equivalent of clean_numeric_value: one translate per cell
+        cleaned = df[col].astype(str).str.translate(NUMERIC_CLEANUP_TABLE)
+        numeric[col] = pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    # Missing columns and unparseable values count as zero
+    values = np.zeros((len(df), len(KPI_COLUMN_TYPES)), dtype=np.float64)
+    for idx, column_type in enumerate(KPI_COLUMN_TYPES):
+        if column_type in needed:
+            values[:, idx] = numeric[needed[column_type]]
+    values[np.isnan(values)] = 0.0
     
-    return kpis
+    revenus, ebitda, resultat_net, free_cash_flow, marge_nette = reduce_kpis(values)
+    return {
+        'revenus_totaux': float(revenus),
+        'ebitda': float(ebitda),
+        'resultat_net': float(resultat_net),
+        'free_cash_flow': float(free_cash_flow),
+        'marge_nette': float(marge_nette)
+    }
 
 # API Routes
 @api_router.get("/")
@@ -163,65 +335,93 @@ async def root():
 @api_router.post("/upload-csv")
 async def upload_csv(file: UploadFile = File(...)):
     """Upload and process CSV file"""
+    # Validate file type
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+    
+    # Read CSV straight from the spooled upload
     try:
-        # Validate file type
-        if not file.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail="File must be a CSV")
-        
-        # Read CSV
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        
-        # Detect columns
-        detected_columns = detect_columns(df)
-        
-        # Calculate KPIs
-        kpis = calculate_kpis(df, detected_columns)
-        
-        # Prepare data for storage
-        financial_data = FinancialData(
-            filename=file.filename,
-            raw_data=df.to_dict('records'),
-            detected_columns=detected_columns,
-            kpis=kpis
+        table = read_csv_table(file.file)
+        df = table.to_pandas()
+    except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
+    
+    # Detect columns and calculate KPIs
+    detected_columns = detect_columns(df)
+    kpis = calculate_kpis(df, detected_columns)
+    
+    # Prepare data for storage (built here, so no validation pass is needed)
+    financial_data = FinancialData.model_construct(
+        filename=file.filename,
+        detected_columns=detected_columns,
+        kpis=kpis
+    )
+    
+    # Store the parsed table in GridFS, keeping the indexed document small
+    bucket = raw_data_bucket()
+    try:
+        await bucket.upload_from_stream_with_id(
+            financial_data.id, file.filename, table_to_ipc_bytes(table)
         )
-        
-        # Store in MongoDB
-        await db.financial_data.insert_one(financial_data.dict())
-        
-        return JSONResponse({
-            "id": financial_data.id,
-            "filename": file.filename,
-            "detected_columns": detected_columns,
-            "kpis": kpis,
-            "data_preview": df.head(5).to_dict('records')
-        })
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Error storing data: {str(e)}")
+    
+    # Store in MongoDB; dict() is a shallow field copy, unlike model_dump()
+    try:
+        await db.financial_data.insert_one(dict(financial_data))
+    except PyMongoError as e:
+        # Don't leave behind a table that no document points to
+        try:
+            await bucket.delete(financial_data.id)
+        except PyMongoError as cleanup_error:
+            logger.warning(f"Could not delete raw data {financial_data.id}: {str(cleanup_error)}")
+        raise HTTPException(status_code=500, detail=f"Error storing data: {str(e)}")
+    
+    return ORJSONResponse({
+        "id": financial_data.id,
+        "filename": file.filename,
+        "detected_columns": detected_columns,
+        "kpis": kpis,
+        "data_preview": df.head(5).to_dict('list')
+    })
 
 @api_router.get("/financial-data/{data_id}")
-async def get_financial_data(data_id: str):
+async def get_financial_data(data_id: str, include_raw_data: bool = True):
     """Get financial data by ID"""
     try:
-        data = await db.financial_data.find_one({"id": data_id})
+        projection = {"_id": 0} if include_raw_data else {"_id": 0, "raw_data": 0}
+        data = await db.financial_data.find_one({"id": data_id}, projection)
         if not data:
             raise HTTPException(status_code=404, detail="Financial data not found")
         
-        return JSONResponse(data)
-        
-    except Exception as e:
+        # Older uploads kept raw_data inline; newer ones keep it in GridFS
+        if include_raw_data and "raw_data" not in data:
+            data["raw_data"] = await load_raw_data(data_id)
+    except (PyMongoError, pa.ArrowInvalid) as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {str(e)}")
+    
+    return ORJSONResponse(data)
 
 @api_router.get("/financial-data")
 async def get_all_financial_data():
     """Get all financial data"""
+    cursor = db.financial_data.find({}, {"_id": 0, "raw_data": 0}).sort("upload_date", -1).limit(100)
     try:
-        data_list = await db.financial_data.find().to_list(100)
-        return JSONResponse(data_list)
-        
-    except Exception as e:
+        # Fetch the first document up front so connection errors still return a 500
+        first = await anext(cursor, None)
+    except PyMongoError as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {str(e)}")
+    
+    async def stream_documents():
+        # Write each document as the cursor yields it instead of buffering the list
+        yield b'['
+        if first is not None:
+            yield orjson.dumps(first, option=ORJSON_OPTIONS)
+            async for doc in cursor:
+                yield b',' + orjson.dumps(doc, option=ORJSON_OPTIONS)
+        yield b']'
+    
+    return StreamingResponse(stream_documents(), media_type="application/json")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -241,6 +441,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    # Indexes only speed up reads; the API still starts when Mongo is down
+    try:
+        await db.financial_data.create_index("id", unique=True)
+        await db.financial_data.create_index([("upload_date", -1)])
+    except PyMongoError as e:
+        logger.warning(f"Could not create financial_data indexes: {str(e)}")
+
+@app.on_event("startup")
+def compile_kpi_reducer():
+    # Compile (or load from cache) before the first upload instead of inside it
+    reduce_kpis(np.zeros((1, len(KPI_COLUMN_TYPES)), dtype=np.float64))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
@@ -264,8 +264,8 @@ function App() {
                 <table className="min-w-full divide-y divide-gray-200">
                   <thead className="bg-gray-50">
                     <tr>
-                      {uploadedData.data_preview && uploadedData.data_preview[0] && 
-                        Object.keys(uploadedData.data_preview[0]).map((key) => (
+                      {uploadedData.data_preview && 
+                        Object.keys(uploadedData.data_preview).map((key) => (
                         <th key={key} className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">
                           {key}
                         </th>
@@ -273,11 +273,11 @@ function App() {
                     </tr>
                   </thead>
                   <tbody className="bg-white divide-y divide-gray-200">
-                    {uploadedData.data_preview && uploadedData.data_preview.slice(0, 5).map((row, idx) => (
+                    {uploadedData.data_preview && (Object.values(uploadedData.data_preview)[0] || []).slice(0, 5).map((_, idx) => (
                       <tr key={idx}>
-                        {Object.values(row).map((cell, cellIdx) => (
+                        {Object.values(uploadedData.data_preview).map((values, cellIdx) => (
                           <td key={cellIdx} className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                            {cell}
+                            {values[idx]}
                           </td>
                         ))}
                       </tr>
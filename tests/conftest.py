@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'backend'))
+
+import server
+
+
+class StubGridOut:
+    def __init__(self, contents):
+        self.contents = contents
+
+    async def read(self):
+        return self.contents
+
+
+class StubBucket:
+    """In-memory stand-in for the raw_data GridFS bucket"""
+
+    def __init__(self):
+        self.files = {}
+
+    async def upload_from_stream_with_id(self, file_id, filename, source):
+        self.files[file_id] = source
+
+    async def open_download_stream(self, file_id):
+        return StubGridOut(self.files[file_id])
+
+    async def delete(self, file_id):
+        del self.files[file_id]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = AsyncMongoMockClient()['test_database']
+    monkeypatch.setattr(server, 'db', db)
+    return db
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = StubBucket()
+    monkeypatch.setattr(server, 'raw_data_bucket', lambda: bucket)
+    return bucket
+
+
+@pytest.fixture
+def api(db, bucket):
+    with TestClient(server.app) as client:
+        yield client
@@ -0,0 +1,243 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def load_csv(text):
+    return server.read_csv_table(io.BytesIO(text.encode())).to_pandas()
+
+
+def detect(*columns):
+    return server.detect_columns(pd.DataFrame(columns=list(columns)))
+
+
+def test_exact_column_name_beats_earlier_substring_match():
+    assert detect('Net Income', 'Revenue')['revenus'] == 'Revenue'
+    assert detect('Net Income', 'Revenue')['resultat_net'] == 'Net Income'
+
+
+def test_exact_names_are_not_claimed_by_other_types():
+    detected = detect('Capex', 'Cash Flow', 'Ventes')
+    assert detected['revenus'] == 'Ventes'
+    assert detected['investissements'] == 'Capex'
+    assert detected['cash_flow'] == 'Cash Flow'
+
+
+def test_substring_match_is_used_when_no_exact_name():
+    detected = detect('Date', 'Total Sales', 'Operating-Expenses')
+    assert detected['revenus'] == 'Total Sales'
+    assert detected['charges'] == 'Operating-Expenses'
+    assert detected['date'] == 'Date'
+
+
+def test_column_can_fill_several_types():
+    detected = detect('EBITDA')
+    assert detected['ebitda'] == 'EBITDA'
+    assert detected['resultat_operationnel'] == 'EBITDA'
+
+
+def test_detected_types_keep_pattern_order():
+    detected = detect('Impots', 'Date', 'Revenus')
+    assert list(detected) == ['revenus', 'impots', 'date']
+
+
+def test_unmatched_columns_are_ignored():
+    assert detect('Region', 'Notes') == {}
+
+
+def test_blank_header_is_named_like_pandas():
+    df = load_csv(",Revenue,Charges\n0,100,50\n1,200,60\n2,300,70\n")
+    assert list(df.columns) == ['Unnamed: 0', 'Revenue', 'Charges']
+
+    detected = server.detect_columns(df)
+    assert 'Unnamed: 0' not in detected.values()
+
+    kpis = server.calculate_kpis(df, detected)
+    assert kpis['ebitda'] == 420.0
+    assert kpis['resultat_net'] == 420.0
+    assert kpis['marge_nette'] == 70.0
+
+
+def test_quoted_newlines_in_files_larger_than_one_block():
+    rows = ''.join(f'"ACME {i}\nParis",{i}\n' for i in range(200000))
+    assert len(rows) > server.CSV_READ_OPTIONS.block_size
+    df = load_csv("Client,Revenue\n" + rows)
+    assert len(df) == 200000
+    assert df['Client'][1] == "ACME 1\nParis"
+    assert server.calculate_kpis(df, server.detect_columns(df))['revenus_totaux'] == sum(range(200000))
+
+
+def test_short_rows_are_padded_like_pandas():
+    df = load_csv("Month,Revenue,Charges\nJan,100,50\nTotal,100\n")
+    assert list(df['Month']) == ['Jan', 'Total']
+    assert df['Charges'].isna().tolist() == [False, True]
+
+    kpis = server.calculate_kpis(df, server.detect_columns(df))
+    assert kpis['revenus_totaux'] == 200.0
+    assert kpis['ebitda'] == 150.0
+
+
+def test_long_rows_are_still_rejected():
+    with pytest.raises(pa.ArrowInvalid):
+        load_csv("a,b\n1,2\n3,4,5\n")
+
+
+def test_date_columns_keep_their_original_text():
+    df = load_csv(
+        "Date,Stamp,Revenue\n"
+        "2024-01-01,2024-01-01T10:00:00+02:00,1\n"
+        "2024-02-01,2024-02-01T10:00:00,2\n"
+    )
+    assert list(df['Date']) == ['2024-01-01', '2024-02-01']
+    assert list(df['Stamp']) == ['2024-01-01T10:00:00+02:00', '2024-02-01T10:00:00']
+
+
+def test_duplicate_headers_are_numbered_like_pandas():
+    df = load_csv("revenue,revenue\n1,2\n")
+    assert list(df.columns) == ['revenue', 'revenue.1']
+
+    detected = server.detect_columns(df)
+    assert detected['revenus'] == 'revenue'
+    assert server.calculate_kpis(df, detected)['revenus_totaux'] == 1.0
+
+
+def test_clean_column_names_skips_existing_suffixes():
+    assert server.clean_column_names(['a', 'a', 'a.1', 'a']) == ['a', 'a.2', 'a.1', 'a.3']
+
+
+def test_nullable_bool_column_counts_true_as_one():
+    df = load_csv("revenue\ntrue\n\ntrue\nfalse\n")
+    kpis = server.calculate_kpis(df, server.detect_columns(df))
+    assert kpis['revenus_totaux'] == 2.0
+
+
+def test_infinite_values_keep_ieee_semantics():
+    df = load_csv("revenue,net_income\n1,inf\n2,1\n")
+    kpis = server.calculate_kpis(df, server.detect_columns(df))
+    assert kpis['resultat_net'] == float('inf')
+
+
+def test_text_columns_are_cleaned_like_clean_numeric_value():
+    df = pd.DataFrame({'Revenue': ['1 200,5 €', '$3', None, 'n/a', 'x' * 2000]})
+    kpis = server.calculate_kpis(df, server.detect_columns(df))
+    expected = sum(server.clean_numeric_value(v) for v in df['Revenue'])
+    assert kpis['revenus_totaux'] == expected == 1203.5
+
+
+def upload(api, text, filename='data.csv', encoding='utf-8'):
+    return api.post('/api/upload-csv', files={'file': (filename, text.encode(encoding), 'text/csv')})
+
+
+def test_upload_rejects_non_csv_filename(api):
+    response = upload(api, "Revenue\n1\n", filename='data.txt')
+    assert response.status_code == 400
+
+
+def test_upload_rejects_non_utf8_header(api):
+    response = upload(api, "Impôts,Revenue\n1,2\n", encoding='latin-1')
+    assert response.status_code == 400
+    assert response.json()['detail'].startswith('Invalid CSV file')
+
+
+def test_raw_data_round_trips_through_gridfs(api, db, bucket):
+    response = upload(api, "Date,Revenue\n2024-01,100\n2024-02,\n")
+    assert response.status_code == 200
+    data_id = response.json()['id']
+
+    assert list(bucket.files) == [data_id]
+    stored = api.portal.call(db.financial_data.find_one, {"id": data_id})
+    assert 'raw_data' not in stored
+
+    data = api.get(f'/api/financial-data/{data_id}').json()
+    assert data['raw_data'] == {'Date': ['2024-01', '2024-02'], 'Revenue': [100, None]}
+    assert '_id' not in data
+
+
+def test_raw_data_is_skipped_when_not_requested(api, bucket):
+    data_id = upload(api, "Revenue\n1\n").json()['id']
+    bucket.files.clear()
+
+    response = api.get(f'/api/financial-data/{data_id}', params={'include_raw_data': 'false'})
+    assert response.status_code == 200
+    assert 'raw_data' not in response.json()
+    assert response.json()['kpis']['revenus_totaux'] == 1.0
+
+
+def test_inline_raw_data_of_older_uploads_is_returned_as_stored(api, db, bucket):
+    api.portal.call(db.financial_data.insert_one, {
+        'id': 'legacy', 'filename': 'old.csv', 'raw_data': [{'Revenue': 1}],
+        'detected_columns': {'revenus': 'Revenue'}, 'kpis': {'revenus_totaux': 1.0}
+    })
+
+    data = api.get('/api/financial-data/legacy').json()
+    assert data['raw_data'] == [{'Revenue': 1}]
+    assert bucket.files == {}
+
+
+def test_failed_insert_removes_the_stored_table(api, db, bucket, monkeypatch):
+    async def failing_insert_one(self, document):
+        raise PyMongoError('insert failed')
+
+    monkeypatch.setattr(type(db.financial_data), 'insert_one', failing_insert_one)
+
+    response = upload(api, "Revenue\n1\n")
+    assert response.status_code == 500
+    assert bucket.files == {}
+
+
+def test_financial_data_list_is_empty_json_array(api):
+    response = api.get('/api/financial-data')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/json'
+    assert response.content == b'[]'
+
+
+def test_financial_data_list_streams_newest_first_without_payload(api, db):
+    for day in (1, 3, 2):
+        api.portal.call(db.financial_data.insert_one, {
+            'id': f'day-{day}', 'upload_date': datetime(2024, 1, day),
+            'raw_data': {'Revenue': [day]}, 'kpis': {'revenus_totaux': float(day)}
+        })
+
+    response = api.get('/api/financial-data')
+    assert response.status_code == 200
+    assert response.content.count(b'},{') == 2
+
+    data = response.json()
+    assert [doc['id'] for doc in data] == ['day-3', 'day-2', 'day-1']
+    assert data[0]['upload_date'] == '2024-01-03T00:00:00'
+    assert all('raw_data' not in doc and '_id' not in doc for doc in data)
+
+
+def test_financial_data_list_returns_500_when_mongo_fails(api, monkeypatch):
+    class FailingCursor:
+        def sort(self, *args):
+            return self
+
+        def limit(self, *args):
+            return self
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            raise PyMongoError('connection refused')
+
+    class FailingCollection:
+        def find(self, *args):
+            return FailingCursor()
+
+    class FailingDatabase:
+        financial_data = FailingCollection()
+
+    monkeypatch.setattr(server, 'db', FailingDatabase())
+
+    response = api.get('/api/financial-data')
+    assert response.status_code == 500
+    assert 'connection refused' in response.json()['detail']